@@ -2,28 +2,77 @@
 # -*- coding: utf-8 -*-
 
 from colorama import Fore, Style, init
-from datetime import datetime, timedelta, time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time
 from dotenv import load_dotenv
-from time import sleep
-import argparse, re, sys
+from functools import lru_cache
+from itertools import pairwise
+import argparse, heapq, json, re, sys
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import shelve
+import threading
+import time as _time
 
-init(autoreset=True)
+# ──────────────────────────────
+#  Amadeus credentials (loaded in main())
+# ──────────────────────────────
+API_KEY: str | None = None
+API_SECRET: str | None = None
 
 # ──────────────────────────────
-#  Amadeus credentials
+#  Flight‑offer cache
 # ──────────────────────────────
-load_dotenv()  # loads from .env by default
-API_KEY = os.getenv("API_KEY")
-API_SECRET = os.getenv("API_SECRET")
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "flight_search")
+_OFFER_CACHE_FILE = os.path.join(CACHE_DIR, "offers")
+_TOKEN_CACHE_FILE = os.path.join(CACHE_DIR, "token.json")
+_OFFER_CACHE: dict[tuple, tuple[float, list]] = {}
+_TTL = 600  # seconds
+_CACHE_LOCK = threading.Lock()
+_CACHE_PRUNED = False
+_TOKEN_LOCK = threading.Lock()  # serialises 401 token refreshes
+_TOKEN_REFRESHED = False
+
+# ──────────────────────────────
+#  Request fan‑out
+# ──────────────────────────────
+MAX_WORKERS = 6  # pool size also caps in‑flight Amadeus calls
+_STDOUT_LOCK = threading.Lock()
+
+# One pooled keep‑alive session for every Amadeus call. Rate‑limit (429) and
+# transient 5xx responses are retried here with exponential backoff.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=1.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False),
+))
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #  Helper utilities
 # ═══════════════════════════════════════════════════════════════════════════════
+def _emit(text: str) -> None:
+    """Write one line/block to stdout without interleaving with worker threads."""
+    with _STDOUT_LOCK:
+        sys.stdout.write(text + "\n")
+
+
 def get_access_token() -> str:
-    resp = requests.post(
+    # Reuse a still‑valid token from a previous run (Amadeus tokens last ~30 min)
+    try:
+        with open(_TOKEN_CACHE_FILE) as fh:
+            cached = json.load(fh)
+        if cached.get("client_id") == API_KEY and _time.time() < cached["expires_at"]:
+            return cached["access_token"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    resp = _SESSION.post(
         "https://test.api.amadeus.com/v1/security/oauth2/token",
         headers={"Content-Type": "application/x-www-form-urlencoded"},
         data={
@@ -33,27 +82,72 @@ def get_access_token() -> str:
         },
     )
     resp.raise_for_status()
-    return resp.json()["access_token"]
-
-
+    data = resp.json()
+    _save_token(data["access_token"], _time.time() + data.get("expires_in", 0) - 60)
+    return data["access_token"]
+
+
+def _refresh_session_token(rejected_auth: str | None) -> None:
+    """Replace a bearer token Amadeus rejected (401), at most once per run."""
+    global _TOKEN_REFRESHED
+    with _TOKEN_LOCK:
+        # Another worker already swapped it, or we already tried once
+        if _TOKEN_REFRESHED or _SESSION.headers.get("Authorization") != rejected_auth:
+            return
+        _TOKEN_REFRESHED = True
+        try:
+            os.remove(_TOKEN_CACHE_FILE)
+        except OSError:
+            pass
+        _SESSION.headers["Authorization"] = f"Bearer {get_access_token()}"
+
+
+def _save_token(token: str, expires_at: float) -> None:
+    """Atomically write the token cache with owner‑only permissions."""
+    tmp = _TOKEN_CACHE_FILE + ".tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as fh:
+            json.dump({"client_id": API_KEY, "access_token": token,
+                       "expires_at": expires_at}, fh)
+        os.replace(tmp, _TOKEN_CACHE_FILE)
+    except OSError as exc:
+        _emit(f"⚠️  Could not persist access token: {exc}")
+
+
+# Offers repeat the same timestamps across sorting, filtering and printing,
+# so parse each ISO string only once.
+_parse_iso = lru_cache(maxsize=4096)(datetime.fromisoformat)
+
+_ISO_DUR_RE = re.compile(r"PT(?:(\d+)H)?(?:(\d+)M)?")
+
+
+@lru_cache(maxsize=1024)
 def iso_duration_to_hm(duration: str) -> tuple[int, int]:
     """Return (hours, minutes) from ISO‑8601 PTxdyyM string."""
-    m = re.match(r"PT(?:(\d+)H)?(?:(\d+)M)?", duration)
+    m = _ISO_DUR_RE.match(duration)
     h = int(m.group(1) or 0)
     mi = int(m.group(2) or 0)
     return h, mi
 
 
-def hm_to_hours(hours: int, minutes: int) -> float:
-    return hours + minutes / 60
+@lru_cache(maxsize=1024)
+def _iso_duration_hours(duration: str) -> float:
+    """Return fractional hours from ISO‑8601 PTxHyyM string (sort‑key path)."""
+    m = _ISO_DUR_RE.match(duration)
+    return int(m.group(1) or 0) + int(m.group(2) or 0) / 60
+
 
+_DAY_IDX = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
 
-def parse_day_time_filters(tokens: list[str]) -> dict[str, tuple[time | None, time | None]]:
+
+def parse_day_time_filters(tokens: list[str]) -> dict[int, Callable[[time], bool]]:
     """
-    Transform tokens like 'Thu(00:00-12:00)' or 'Sat' into a mapping:
-    { 'thu': (start_time|None, end_time|None) }
+    Transform tokens like 'Thu(00:00-12:00)' or 'Sat' into a mapping keyed
+    by weekday index (Mon=0) to a time‑of‑day predicate: { 3: pred }
     """
-    filters: dict[str, tuple[time | None, time | None]] = {}
+    filters: dict[int, Callable[[time], bool]] = {}
     for t in tokens:
         t = t.strip()
         if "(" in t and ")" in t:
@@ -67,47 +161,40 @@ def parse_day_time_filters(tokens: list[str]) -> dict[str, tuple[time | None, ti
                 sys.exit(f"‼️  Bad time range in '{t}'. Expected HH:MM-HH:MM.")
         else:
             day, start_t, end_t = t, None, None
-        filters[day.lower()[:3]] = (start_t, end_t)
+        try:
+            idx = _DAY_IDX[day.lower()[:3]]
+        except KeyError:
+            sys.exit(f"‼️  Unknown day in '{t}'. Expected Mon, Tue, … Sun.")
+        filters[idx] = time_window(start_t, end_t)
     return filters
 
 
-def time_in_window(t: time, start: time | None, end: time | None) -> bool:
+def time_window(start: time | None, end: time | None) -> Callable[[time], bool]:
+    """Return a predicate for 'start <= t <= end', specialised once per filter."""
     if start is None or end is None:
-        return True
+        return lambda t: True
     if start <= end:
-        return start <= t <= end
+        return lambda t, s=start, e=end: s <= t <= e
     # over‑midnight window
-    return t >= start or t <= end
+    return lambda t, s=start, e=end: t >= s or t <= e
 
 
-def day_period(hour: int) -> str:
-    """Return 'day' (06‑22) or 'night'."""
-    return "day" if 6 <= hour < 22 else "night"
+_KEY_FNS = {
+    "price":          lambda o: float(o["price"]["total"]),
+    "departure_date": lambda o: _parse_iso(o["itineraries"][0]["segments"][0]["departure"]["at"]),
+    "duration":       lambda o: _iso_duration_hours(o["itineraries"][0]["duration"]),
+    "return_date":    lambda o: _parse_iso(o["itineraries"][-1]["segments"][-1]["arrival"]["at"]),
+}
 
 
-def sort_offers(offers, sort_keys):
-    def key_fn(offer):
-        itin  = offer["itineraries"][0]
-        segs  = itin["segments"]
-        dep   = segs[0]["departure"]["at"]
-        ret   = offer["itineraries"][-1]["segments"][-1]["arrival"]["at"]
-        price = float(offer["price"]["total"])
-        h, m  = iso_duration_to_hm(itin["duration"])
-        dur   = hm_to_hours(h, m)
-        mapping = {
-            "price": price,
-            "departure_date": datetime.fromisoformat(dep),
-            "duration": dur,
-            "return_date": datetime.fromisoformat(ret),
-        }
-        return tuple(mapping[k] for k in sort_keys)
-    return sorted(offers, key=key_fn)
+def _build_key_fn(sort_keys):
+    """Return a tuple‑key callable computing only the requested sort fields."""
+    extractors = [_KEY_FNS[k] for k in sort_keys]
+    return lambda o: tuple(f(o) for f in extractors)
 
 
-def hours_between(dt1: str, dt2: str) -> float:
-    t1 = datetime.fromisoformat(dt1)
-    t2 = datetime.fromisoformat(dt2)
-    return abs((t2 - t1).total_seconds() / 3600)
+def hours_between(dt1: datetime, dt2: datetime) -> float:
+    return abs((dt2 - dt1).total_seconds() / 3600)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -212,16 +299,16 @@ EXAMPLES
     return p
 
 
-ARGS = build_parser().parse_args()
-if not ARGS.sort_by:
-    ARGS.sort_by = ["price", "departure_date", "duration", "return_date"]
+# Populated by main() so importing this module has no side effects
+ARGS: argparse.Namespace | None = None
 ALL_MATCHES: list[dict] = []
+_SEEN_OFFERS: set[tuple] = set()
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #  Date‑pair generator
 # ═══════════════════════════════════════════════════════════════════════════════
-def expand_stay_durations(tokens: list[str | int]) -> list[int]:
+def expand_stay_durations(tokens: list[str | int]) -> tuple[int, ...]:
     nights = set()
     for tok in tokens:
         s = str(tok)
@@ -236,116 +323,207 @@ def expand_stay_durations(tokens: list[str | int]) -> list[int]:
                 nights.add(int(s))
             except ValueError:
                 sys.exit(f"‼️ Invalid number in --max-stay: {s}")
-    return sorted(nights)
+    return tuple(sorted(nights))
+
+
+def parse_range_length(text: str) -> int:
+    """Return total days from strings like '5 weeks', '1 week 3 days' or '10'."""
+    total = 0
+    tokens = text.lower().split()
+    for i, tok in enumerate(tokens):
+        if not tok.isdigit():
+            continue
+        unit = tokens[i + 1] if i + 1 < len(tokens) else "days"
+        total += int(tok) * (7 if unit.startswith("week") else 1)
+    if total <= 0:
+        sys.exit(f"‼️ Invalid --range-length: {text}")
+    return total
+
+
+def _pair_ordinals(first: int, last: int, stays: tuple[int, ...],
+                   ret_lo: int, ret_hi: int) -> Iterator[tuple[int, int]]:
+    """Yield (depart, return) date ordinals for every depart day and stay."""
+    for dep in range(first, last + 1):
+        for stay in stays:
+            ret = dep + stay
+            if ret_lo <= ret <= ret_hi:
+                yield dep, ret
 
 
 def make_date_pairs() -> list[tuple[str, str]]:
-    pairs: list[tuple[str, str]] = []
+    pairs: set[tuple[str, str]] = set()
     if ARGS.max_stay:
         ARGS.max_stay = expand_stay_durations(ARGS.max_stay)
 
-    if ARGS.range_length and ARGS.max_stay:
-        base = datetime.fromisoformat(ARGS.range_start).date() if ARGS.range_start else datetime.today().date()
-        total_days = parse_range_length(ARGS.range_length)
-        for offset in range(total_days):
-            d_date = base + timedelta(days=offset)
-            for stay in ARGS.max_stay:
-                r_date = d_date + timedelta(days=stay)
-                pairs.append((d_date.isoformat(), r_date.isoformat()))
-    elif ARGS.depart_start and ARGS.depart_end and ARGS.max_stay:
-        start = datetime.fromisoformat(ARGS.depart_start).date()
-        end   = datetime.fromisoformat(ARGS.depart_end).date()
-        while start <= end:
-            for stay in ARGS.max_stay:
-                ret = start + timedelta(days=stay)
-                if ARGS.return_start and ret < datetime.fromisoformat(ARGS.return_start).date():
-                    continue
-                if ARGS.return_end and ret > datetime.fromisoformat(ARGS.return_end).date():
-                    continue
-                pairs.append((start.isoformat(), ret.isoformat()))
-            start += timedelta(days=1)
+    if (ARGS.range_length or (ARGS.depart_start and ARGS.depart_end)) and ARGS.max_stay:
+        # Work on integer day ordinals and only stringify at the edge.
+        if ARGS.range_length:
+            base  = date.fromisoformat(ARGS.range_start) if ARGS.range_start else date.today()
+            first = base.toordinal()
+            last  = first + parse_range_length(ARGS.range_length) - 1
+        else:
+            first = date.fromisoformat(ARGS.depart_start).toordinal()
+            last  = date.fromisoformat(ARGS.depart_end).toordinal()
+        ret_lo = date.fromisoformat(ARGS.return_start).toordinal() if ARGS.return_start else 0
+        ret_hi = date.fromisoformat(ARGS.return_end).toordinal() if ARGS.return_end else date.max.toordinal()
+
+        pairs.update((date.fromordinal(d).isoformat(), date.fromordinal(r).isoformat())
+                     for d, r in _pair_ordinals(first, last, ARGS.max_stay, ret_lo, ret_hi))
     elif ARGS.depart and ARGS.ret:
-        pairs.append((ARGS.depart, ARGS.ret))
+        pairs.add((ARGS.depart, ARGS.ret))
     else:
         sys.exit("‼️  Provide either fixed dates or a flexible range.")
-    return pairs
+    # Unique pairs only: each one drives an API call per origin/destination
+    return sorted(pairs)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #  Day/time filter helpers
 # ═══════════════════════════════════════════════════════════════════════════════
-DEPART_DAY_FILTER = parse_day_time_filters(ARGS.filter_depart_days_time or [])
-RETURN_DAY_FILTER = parse_day_time_filters(ARGS.filter_return_days_time or [])
+DEPART_DAY_FILTER: dict[int, Callable[[time], bool]] = {}
+RETURN_DAY_FILTER: dict[int, Callable[[time], bool]] = {}
 
 def depart_ok(dep_iso: str) -> bool:
     if not DEPART_DAY_FILTER:
         return True
-    dt = datetime.fromisoformat(dep_iso)
-    key = dt.strftime("%a").lower()[:3]
-    if key not in DEPART_DAY_FILTER:
-        return False
-    start, end = DEPART_DAY_FILTER[key]
-    return time_in_window(dt.time(), start, end)
+    dt = _parse_iso(dep_iso)
+    pred = DEPART_DAY_FILTER.get(dt.weekday())
+    return pred is not None and pred(dt.time())
 
 def return_ok(dep_iso: str) -> bool:
     if not RETURN_DAY_FILTER:
         return True
-    dt = datetime.fromisoformat(dep_iso)
-    key = dt.strftime("%a").lower()[:3]
-    if key not in RETURN_DAY_FILTER:
-        return False
-    start, end = RETURN_DAY_FILTER[key]
-    return time_in_window(dt.time(), start, end)
+    dt = _parse_iso(dep_iso)
+    pred = RETURN_DAY_FILTER.get(dt.weekday())
+    return pred is not None and pred(dt.time())
 
-# stopover limits
-def stop_limits(kind: str, hour: int) -> float:
-    values = getattr(ARGS, f"max_{kind}_stopover") or []
-    if not values:
-        return float("inf")
-    if len(values) == 1:
-        return values[0]
-    # 2 values: [day, night]
-    return values[0] if day_period(hour) == "day" else values[1]
+def _day_allowed(day_filter: dict, iso_date: str) -> bool:
+    """Date‑only pre‑check: is the weekday of 'YYYY-MM-DD' allowed at all?"""
+    if not day_filter:
+        return True
+    return date.fromisoformat(iso_date).weekday() in day_filter
+
+def _depart_ok_date(iso_date: str) -> bool:
+    return _day_allowed(DEPART_DAY_FILTER, iso_date)
+
+def _return_ok_date(iso_date: str) -> bool:
+    return _day_allowed(RETURN_DAY_FILTER, iso_date)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #  Flight search & printing
 # ═══════════════════════════════════════════════════════════════════════════════
 def run_search():
-    token = get_access_token()
+    _SESSION.headers["Authorization"] = f"Bearer {get_access_token()}"
     date_pairs = make_date_pairs()
 
-    for orig in ARGS.origins:
-        for dest in ARGS.destinations:
-            for d_date, r_date in date_pairs:
-                # Check if departure/return pass the day-time filters before making request
-                if not depart_ok(d_date + "T12:00:00"):
-                    continue
-                if not return_ok(r_date + "T12:00:00"):
+    # Day filters depend only on the date pair, so apply them once before
+    # fanning out; time windows are checked later against actual offers.
+    valid_pairs = [(d, r) for d, r in date_pairs
+                   if _depart_ok_date(d) and _return_ok_date(r)]
+    tasks = [
+        (orig, dest, d_date, r_date)
+        for orig in ARGS.origins
+        for dest in ARGS.destinations
+        for d_date, r_date in valid_pairs
+    ]
+
+    key_fn = _build_key_fn(ARGS.sort_by)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = {ex.submit(call_amadeus, *task): task for task in tasks}
+
+        try:
+            for fut in as_completed(futures):
+                orig, dest, d_date, r_date = futures[fut]
+                _emit(f"{Fore.BLUE}Checking {orig} → {dest} | {d_date} → {r_date}...{Style.RESET_ALL}")
+                offers = fut.result()
+                # Filter before dedup so a filtered‑out duplicate can't shadow a valid one
+                valid = [o for o in offers or [] if offer_ok(o)]
+                if not valid:
                     continue
 
-                print(f"{Fore.BLUE}Checking {orig} → {dest} | {d_date} → {r_date}...{Style.RESET_ALL}")
-                offers = call_amadeus(token, orig, dest, d_date, r_date)
-                if not offers:
-                    continue
-
-                sorted_offers = sort_offers(offers, ARGS.sort_by)
-                best_offer = sorted_offers[0]
+                best_offer = min(valid, key=key_fn)
                 display_offers([best_offer])   # 🟨 Show only best for this query
 
-                ALL_MATCHES.extend(offers)
+                for o in valid:
+                    k = _offer_key(o)
+                    if k in _SEEN_OFFERS:
+                        continue
+                    _SEEN_OFFERS.add(k)
+                    ALL_MATCHES.append(o)
+        except BaseException:
+            # Fatal error or Ctrl‑C: don't keep sending the queued requests
+            ex.shutdown(wait=False, cancel_futures=True)
+            raise
 
     # Final summary
     print(f"\n{Fore.YELLOW}🏁 Displaying top {ARGS.max_results} result(s)...\n")
-    top = sort_offers(ALL_MATCHES, ARGS.sort_by)[:ARGS.max_results]
+    top = heapq.nsmallest(ARGS.max_results, ALL_MATCHES, key=key_fn)
     display_offers(top)
 
 
 
-def call_amadeus(token: str, origin: str, destination: str,
+def _cache_get(key: tuple) -> list | None:
+    """Return cached offers for *key* if still fresh (memory first, then disk)."""
+    entry = _OFFER_CACHE.get(key)
+    if entry is None:
+        try:
+            with _CACHE_LOCK, shelve.open(_OFFER_CACHE_FILE, flag="r") as db:
+                entry = db.get(repr(key))
+        except Exception:
+            entry = None
+        if entry is not None:
+            _OFFER_CACHE[key] = entry
+    if entry and _time.time() - entry[0] < _TTL:
+        return entry[1]
+    return None
+
+
+def _prune_offer_cache(now: float) -> None:
+    """Drop expired entries from the on‑disk cache (once per run, lock held)."""
+    global _CACHE_PRUNED
+    _CACHE_PRUNED = True
+    with shelve.open(_OFFER_CACHE_FILE) as db:
+        fresh = {k: v for k, v in db.items() if now - v[0] < _TTL}
+        if len(fresh) == len(db):
+            return
+    # Some dbm backends never reclaim deleted space, so rewrite the file
+    # with only the live entries to keep it bounded.
+    with shelve.open(_OFFER_CACHE_FILE, flag="n") as db:
+        db.update(fresh)
+
+
+def _cache_set(key: tuple, offers: list) -> None:
+    now = _time.time()
+    entry = (now, offers)
+    _OFFER_CACHE[key] = entry
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with _CACHE_LOCK:
+            if not _CACHE_PRUNED:
+                _prune_offer_cache(now)
+            with shelve.open(_OFFER_CACHE_FILE) as db:
+                db[repr(key)] = entry
+    except Exception as exc:
+        _emit(f"⚠️  Could not persist offer cache: {exc}")
+
+
+def _offer_key(offer: dict) -> tuple:
+    """Dedup key: (outbound departure, inbound departure, price) as raw strings."""
+    itin = offer["itineraries"]
+    return (itin[0]["segments"][0]["departure"]["at"],
+            itin[-1]["segments"][0]["departure"]["at"],
+            offer["price"]["total"])
+
+
+def call_amadeus(origin: str, destination: str,
                  depart: str, ret: str) -> None:
+    key = (origin, destination, depart, ret, ARGS.nonstop, ARGS.max_results)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
     base_url = "https://test.api.amadeus.com/v2/shopping/flight-offers"
-    headers  = {"Authorization": f"Bearer {token}"}
     params   = {
         "originLocationCode":      origin,
         "destinationLocationCode": destination,
@@ -356,104 +534,125 @@ def call_amadeus(token: str, origin: str, destination: str,
         "currencyCode":            "GBP",
         "nonStop":                 "true" if ARGS.nonstop else "false",
     }
-    # Retry logic for rate limit
-    for attempt in range(3):
-        rsp = requests.get(base_url, headers=headers, params=params)
-        if rsp.status_code != 429:
-            break
-        print("⚠️  Rate limit hit. Waiting 5 seconds before retrying...")
-        sleep(7)
-    else:
-        print("❌ Amadeus still rate-limiting after retries. Skipping...")
+    # Rate‑limit retries/backoff are handled by the session's Retry policy
+    auth = _SESSION.headers.get("Authorization")
+    rsp = _SESSION.get(base_url, params=params)
+    if rsp.status_code == 401:
+        # Cached token revoked or secret rotated: drop it and retry once
+        _refresh_session_token(auth)
+        rsp = _SESSION.get(base_url, params=params)
+    if rsp.status_code == 429:
+        _emit("❌ Amadeus still rate-limiting after retries. Skipping...")
         return
 
     if rsp.status_code != 200:
-        print("Amadeus error:", rsp.json())
+        _emit(f"Amadeus error: {rsp.json()}")
         return []
 
-    offers = sort_offers(rsp.json()["data"], ARGS.sort_by)
+    offers = rsp.json()["data"]
+    _cache_set(key, offers)
     return offers
 
 
+def offer_ok(offer: dict) -> bool:
+    """Apply the day/time and stop‑over filters to a single offer."""
+    to_itin   = offer["itineraries"][0]      # outbound
+    from_itin = offer["itineraries"][-1]     # inbound
+    return (depart_ok(to_itin["segments"][0]["departure"]["at"])
+            and return_ok(from_itin["segments"][0]["departure"]["at"])
+            and stopovers_ok(to_itin, "departure")
+            and stopovers_ok(from_itin, "return"))
+
+
 def display_offers(offers) -> None:
-    seen: set[tuple] = set()
     for offer in offers:
+        if not offer_ok(offer):
+            continue
+
         price = offer["price"]["total"]
         to_itin   = offer["itineraries"][0]      # outbound
         from_itin = offer["itineraries"][-1]     # inbound
-
-        # --- Outbound checks ---------------------------------------------------
-        dep_seg = to_itin["segments"][0]
-        if not depart_ok(dep_seg["departure"]["at"]):
-            continue
-
-        # --- Inbound checks ----------------------------------------------------
-        ret_seg = from_itin["segments"][0]
-        if not return_ok(ret_seg["departure"]["at"]):
-            continue
-
-        # --- Stop‑over filtering ----------------------------------------------
-        if not stopovers_ok(to_itin, "departure") or not stopovers_ok(from_itin, "return"):
-            continue
-
-        key = (dep_seg["departure"]["at"], ret_seg["departure"]["at"], price)
-        if key in seen:
-            continue
-        seen.add(key)
+        dep_seg     = to_itin["segments"][0]
+        ret_segs    = from_itin["segments"]
+        ret_dep_seg = ret_segs[0]
+        ret_arr_seg = ret_segs[-1]
 
         # ---------- PRINT ------------------------------------------------------
+        lines: list[str] = []
         duration_h, duration_m = iso_duration_to_hm(to_itin["duration"])
-        dep_dt = datetime.fromisoformat(dep_seg["departure"]["at"])
-        arr_dt = datetime.fromisoformat(to_itin["segments"][-1]["arrival"]["at"])
-        ret_dt = datetime.fromisoformat(ret_seg["departure"]["at"])
+        dep_dt = _parse_iso(dep_seg["departure"]["at"])
+        arr_dt = _parse_iso(to_itin["segments"][-1]["arrival"]["at"])
         num_stops = len(to_itin["segments"]) - 1
-        print(f"{Fore.GREEN}£{price} | {duration_h}h{duration_m:02d}m | Stops {num_stops}")
-        print(f"{Fore.YELLOW}From:  {dep_seg['departure']['iataCode']}  {dep_dt.isoformat()} ({dep_dt.strftime('%A')})")
-        print(f"{Fore.CYAN}To:    {to_itin['segments'][-1]['arrival']['iataCode']}  {arr_dt.isoformat()} ({arr_dt.strftime('%A')})")
+        lines.append(f"{Fore.GREEN}£{price} | {duration_h}h{duration_m:02d}m | Stops {num_stops}")
+        lines.append(f"{Fore.YELLOW}From:  {dep_seg['departure']['iataCode']}  {dep_dt.isoformat()} ({dep_dt.strftime('%A')})")
+        lines.append(f"{Fore.CYAN}To:    {to_itin['segments'][-1]['arrival']['iataCode']}  {arr_dt.isoformat()} ({arr_dt.strftime('%A')})")
         if num_stops > 0:
-            for i in range(1, len(to_itin["segments"])):
-                prev_arr = datetime.fromisoformat(to_itin["segments"][i - 1]["arrival"]["at"])
-                next_dep = datetime.fromisoformat(to_itin["segments"][i]["departure"]["at"])
-                stop = to_itin["segments"][i]["departure"]["iataCode"]
-                wait_hrs = (next_dep - prev_arr).total_seconds() / 3600
+            for prev, cur in pairwise(to_itin["segments"]):
+                prev_arr = _parse_iso(prev["arrival"]["at"])
+                next_dep = _parse_iso(cur["departure"]["at"])
+                stop = cur["departure"]["iataCode"]
+                wait_hrs = hours_between(prev_arr, next_dep)
                 wait_fmt = f"{int(wait_hrs)}h {int((wait_hrs % 1) * 60)}m"
-                print(f"{Fore.LIGHTBLACK_EX}  ↪ Stopover at {stop} for {wait_fmt}")
+                lines.append(f"{Fore.LIGHTBLACK_EX}  ↪ Stopover at {stop} for {wait_fmt}")
         # -- Return itinerary (pretty print)
-        ret_segs = from_itin["segments"]
-        ret_dep_seg = ret_segs[0]
-        ret_arr_seg = ret_segs[-1]
-        ret_dep_time = datetime.fromisoformat(ret_dep_seg["departure"]["at"])
-        ret_arr_time = datetime.fromisoformat(ret_arr_seg["arrival"]["at"])
+        ret_dep_time = _parse_iso(ret_dep_seg["departure"]["at"])
+        ret_arr_time = _parse_iso(ret_arr_seg["arrival"]["at"])
 
-        print(f"{Fore.BLUE}Return:")
-        print(f"  From:  {ret_dep_seg['departure']['iataCode']}  {ret_dep_seg['departure']['at']} ({ret_dep_time.strftime('%A')})")
-        print(f"  To:    {ret_arr_seg['arrival']['iataCode']}  {ret_arr_seg['arrival']['at']} ({ret_arr_time.strftime('%A')})")
+        lines.append(f"{Fore.BLUE}Return:")
+        lines.append(f"  From:  {ret_dep_seg['departure']['iataCode']}  {ret_dep_seg['departure']['at']} ({ret_dep_time.strftime('%A')})")
+        lines.append(f"  To:    {ret_arr_seg['arrival']['iataCode']}  {ret_arr_seg['arrival']['at']} ({ret_arr_time.strftime('%A')})")
 
         if len(ret_segs) > 1:
-            for i in range(1, len(ret_segs)):
-                prev_arr  = datetime.fromisoformat(ret_segs[i - 1]["arrival"]["at"])
-                next_dep  = datetime.fromisoformat(ret_segs[i]["departure"]["at"])
-                stop_code = ret_segs[i]["departure"]["iataCode"]
-                wait_hr   = (next_dep - prev_arr).total_seconds() / 3600
+            for prev, cur in pairwise(ret_segs):
+                prev_arr  = _parse_iso(prev["arrival"]["at"])
+                next_dep  = _parse_iso(cur["departure"]["at"])
+                stop_code = cur["departure"]["iataCode"]
+                wait_hr   = hours_between(prev_arr, next_dep)
                 wait_fmt  = f"{int(wait_hr)}h {int((wait_hr % 1) * 60)}m"
-                print(f"{Fore.LIGHTBLACK_EX}  ↪ Stopover at {stop_code} for {wait_fmt}")
+                lines.append(f"{Fore.LIGHTBLACK_EX}  ↪ Stopover at {stop_code} for {wait_fmt}")
 
-        print(Style.RESET_ALL + "-"*60)
+        lines.append(Style.RESET_ALL + "-"*60)
+        # One write per offer; reset after each line as autoreset did per print.
+        _emit(f"{Style.RESET_ALL}\n".join(lines))
 
 
 def stopovers_ok(itinerary: dict, kind: str) -> bool:
-    max_day, max_night = stop_limits(f"{kind}", 12), stop_limits(f"{kind}", 0)  # just to get both
     segs = itinerary["segments"]
-    for i in range(1, len(segs)):
-        prev_arr  = datetime.fromisoformat(segs[i-1]["arrival"]["at"])
-        next_dep  = datetime.fromisoformat(segs[i]["departure"]["at"])
-        wait_hr   = hours_between(prev_arr.isoformat(), next_dep.isoformat())
-        limit     = stop_limits(f"{kind}", prev_arr.hour)
-        if wait_hr > limit or (ARGS.max_stops is not None and len(segs)-1 > ARGS.max_stops):
+    n_stops = len(segs) - 1
+    if ARGS.max_stops is not None and n_stops > ARGS.max_stops:
+        return False
+
+    # One value ⇒ applies to day+night. Two ⇒ [day, night] (day = 06‑22).
+    vals = getattr(ARGS, f"max_{kind}_stopover") or None
+    if vals is None:
+        return True
+    for prev, cur in pairwise(segs):
+        prev_arr  = _parse_iso(prev["arrival"]["at"])
+        next_dep  = _parse_iso(cur["departure"]["at"])
+        wait_hr   = (next_dep - prev_arr).total_seconds() / 3600
+        limit     = vals[0] if len(vals) == 1 or 6 <= prev_arr.hour < 22 else vals[1]
+        if wait_hr > limit:
             return False
     return True
 
 
 # ════════════════════
-if __name__ == "__main__":
+def main(argv: list[str] | None = None) -> None:
+    global API_KEY, API_SECRET, ARGS, DEPART_DAY_FILTER, RETURN_DAY_FILTER, ALL_MATCHES
+    init(autoreset=True)
+    load_dotenv()  # loads from .env by default
+    API_KEY = os.getenv("API_KEY")
+    API_SECRET = os.getenv("API_SECRET")
+
+    ARGS = build_parser().parse_args(argv)
+    if not ARGS.sort_by:
+        ARGS.sort_by = ["price", "departure_date", "duration", "return_date"]
+    DEPART_DAY_FILTER = parse_day_time_filters(ARGS.filter_depart_days_time or [])
+    RETURN_DAY_FILTER = parse_day_time_filters(ARGS.filter_return_days_time or [])
+    ALL_MATCHES = []
+    _SEEN_OFFERS.clear()
     run_search()
+
+
+if __name__ == "__main__":
+    main()